@@ -2,31 +2,48 @@ import sys
 import logging
 from PySide6.QtWidgets import (QApplication, QMainWindow, QLabel, QVBoxLayout, QHBoxLayout, QWidget,
                                QPushButton, QStackedWidget)
-from PySide6.QtCore import Qt, Signal, QThread, QTimer
+from PySide6.QtCore import Qt, Signal, QThread
 from PySide6.QtGui import QPixmap
 import serial
+from serial.tools import list_ports
 import time
 import numpy as np
 import struct
-import glob
+import queue
 
 # Настройка логирования
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Корневой логгер: дорогое форматирование (hex, массивы) выполняем только при включённом DEBUG
+logger = logging.getLogger()
 
 Commands = {
     'GET_SPECTRUM_FLOAT': 0xC2
 }
 
+# Минимальная длина данных, с которой выгоднее векторный расчёт контрольной суммы
+FLETCHER_VECTOR_MIN_LEN = 64
+# Убывающие веса n, n-1, ..., 1 для CK_B, рассчитанные один раз на пакет максимальной длины
+_FLETCHER_WEIGHTS = np.arange(6 + 0xFFFF, 0, -1, dtype=np.int64)
+
 def fletcher_checksum(data):
-    CK_A = 0
-    CK_B = 0
-    for byte in data:
-        CK_A = (CK_A + byte) % 256
-        CK_B = (CK_B + CK_A) % 256
+    if len(data) < FLETCHER_VECTOR_MIN_LEN:
+        CK_A = 0
+        CK_B = 0
+        for byte in data:
+            CK_A = (CK_A + byte) % 256
+            CK_B = (CK_B + CK_A) % 256
+        return CK_A, CK_B
+
+    # Замкнутая форма: CK_A = Σbᵢ, CK_B = Σ(n - i)·bᵢ (по модулю 256)
+    arr = np.frombuffer(data, dtype=np.uint8)
+    weights = _FLETCHER_WEIGHTS[len(_FLETCHER_WEIGHTS) - len(arr):]
+    CK_A = int(arr.sum() % 256)
+    CK_B = int(np.dot(weights, arr) % 256)
     return CK_A, CK_B
 
 def parse_response(buffer):
     try:
+        mv = memoryview(buffer)
         if len(buffer) < 6:
             logging.warning(f"Buffer too short to parse: {len(buffer)} bytes")
             return None, None
@@ -41,66 +58,81 @@ def parse_response(buffer):
             logging.warning(f"Incorrect command code: {cmd:#02x}")
             return None, None
 
-        payload_len = struct.unpack('<H', buffer[2:4])[0]
+        payload_len = struct.unpack_from('<H', mv, 2)[0]
         if len(buffer) < 6 + payload_len:
             logging.warning(f"Incomplete packet: expected {6 + payload_len} bytes, got {len(buffer)}")
             return None, None
 
-        received_crc = struct.unpack('<H', buffer[4 + payload_len:6 + payload_len])[0]
-        calc_crc1, calc_crc2 = fletcher_checksum(buffer[:4 + payload_len])
+        received_crc = struct.unpack_from('<H', mv, 4 + payload_len)[0]
+        calc_crc1, calc_crc2 = fletcher_checksum(mv[:4 + payload_len])
         calculated_crc = (calc_crc2 << 8) | calc_crc1
 
         if received_crc != calculated_crc:
             logging.warning(f"CRC mismatch: received {received_crc:#06x}, calculated {calculated_crc:#06x}")
             return None, None
 
-        data = buffer[4:4 + payload_len]
-        num_floats = len(data) // 4
+        num_floats = payload_len // 4
 
         if num_floats % 2 != 0:
             logging.warning(f"Incorrect number of floats: {num_floats}")
             return None, None
 
-        float_data = struct.unpack(f'<{num_floats}f', data)
-        mags = np.array(float_data[:num_floats // 2])
-        freqs = np.array(float_data[num_floats // 2:]) / 1e6  # Конвертация в MHz
+        float_data = np.frombuffer(mv, dtype='<f4', count=num_floats, offset=4)
+        # Амплитуды остаются float32: для сравнения с порогом точности хватает
+        mags = float_data[:num_floats // 2]
+        freqs = float_data[num_floats // 2:].astype(np.float64) * 1e-6  # Конвертация в MHz
 
         # Логирование значений частот для проверки
-        logging.debug(f"Parsed frequencies (MHz): {freqs}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed frequencies (MHz): {freqs}")
 
         return mags, freqs
     except Exception as e:
         logging.error(f"Error parsing response: {e}")
         return None, None
 
+# Неизменные части команды GET_SPECTRUM_FLOAT: заголовок и параметры rfin, bw, speed
+_SPECTRUM_CMD_HEADER = struct.pack('<BBH', 0xBB, Commands['GET_SPECTRUM_FLOAT'], 19)
+_SPECTRUM_CMD_TAIL = bytes([2, 3, 0])
+# Готовые команды GET_SPECTRUM_FLOAT по ключу (start_freq, stop_freq)
+_CMD_CACHE = {}
+
 def get_spectrum(serial_conn, start_freq=800e6, stop_freq=4800e6):
-    command = struct.pack(
-        '<BBHQQBBB',
-        0xBB,
-        Commands['GET_SPECTRUM_FLOAT'],
-        19,
-        int(start_freq),
-        int(stop_freq),
-        2, 3, 0
-    )
-    crc1, crc2 = fletcher_checksum(command)
-    command += struct.pack('<BB', crc1, crc2)
-    logging.debug(f"Sent GET_SPECTRUM_FLOAT command: {command.hex()}")
+    key = (int(start_freq), int(stop_freq))
+    command = _CMD_CACHE.get(key)
+    if command is None:
+        body = _SPECTRUM_CMD_HEADER + struct.pack('<QQ', *key) + _SPECTRUM_CMD_TAIL
+        crc1, crc2 = fletcher_checksum(body)
+        command = body + bytes([crc1, crc2])
+        _CMD_CACHE[key] = command
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Sent GET_SPECTRUM_FLOAT command: {command.hex()}")
     serial_conn.write(command)
 
 class SpectrumWorker(QThread):
-    data_updated = Signal(list, list)
     status_changed = Signal(str)
     alert_triggered = Signal(float, float)
-    raw_data_received = Signal(bytes)
+    raw_data_received = Signal(object)  # memoryview на принятые байты
 
-    def __init__(self):
+    # Команды светодиоду Arduino
+    _CMD_ON = b'1'
+    _CMD_OFF = b'0'
+
+    def __init__(self, data_queue):
         super().__init__()
+        # Спектры (freqs, mags) передаются в GUI через очередь, а не сигналом на каждый пакет
+        self.data_queue = data_queue
+        self._sent_freqs = None  # Последняя переданная в GUI сетка частот
         self.running = False
         self.threshold = -97  # Порог для включения светодиода
         self.port = '/dev/ttyACM0'  # Порт основного устройства
         self.baudrate = 115200
+        self.ser = None
+        self.request_interval = 1.0  # Период запроса спектра, с
         self.buffer = bytearray()
+        # Предел буфера приёма: вмещает два пакета максимальной длины (6 + 65535 байт)
+        self.max_buffer_size = 128 * 1024
+        self._scan_start = 0  # Позиция, до которой буфер уже проверен на наличие 0xBB
         self.last_alert_time = 0
         self.min_alert_interval = 1
 
@@ -108,6 +140,7 @@ class SpectrumWorker(QThread):
         self.arduino_port = '/dev/ttyACM1'  # ЗАМЕНИТЕ НА ВАШ ПОРТ!
         self.arduino_baudrate = 9600
         self.arduino_conn = None
+        self._led_state = None  # Последняя отправленная команда светодиоду
 
     def connect_to_device(self):
         try:
@@ -124,7 +157,7 @@ class SpectrumWorker(QThread):
                 bytesize=8,
                 parity='N',
                 stopbits=1,
-                timeout=2
+                timeout=self.request_interval  # Чтение не задерживает следующий запрос спектра
             )
             self.status_changed.emit("Устройство подключено")
             logging.info(f"Connected to {self.port} at {self.baudrate} baud")
@@ -146,6 +179,7 @@ class SpectrumWorker(QThread):
                 baudrate=self.arduino_baudrate,
                 timeout=1
             )
+            self._led_state = None  # Состояние светодиода после переподключения неизвестно
             logging.info(f"Connected to Arduino at {self.arduino_port}")
             return True
         except Exception as e:
@@ -156,30 +190,29 @@ class SpectrumWorker(QThread):
     def send_to_arduino(self, command):
         if self.arduino_conn and self.arduino_conn.is_open:
             try:
-                self.arduino_conn.write(command.encode())
+                self.arduino_conn.write(command)
                 logging.debug(f"Sent to Arduino: {command}")
+                return True
             except Exception as e:
                 logging.error(f"Error sending to Arduino: {e}")
+        return False
 
     def list_available_ports(self):
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif sys.platform.startswith('darwin'):
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
-
-        result = []
-        for port in ports:
-            try:
-                s = serial.Serial(port)
-                s.close()
-                result.append(port)
-            except (OSError, serial.SerialException):
-                pass
-        return result
+        # Перечисление портов средствами ОС вместо попыток открыть каждый /dev/tty* или COM1..COM256;
+        # оставляем только USB-устройства (у них есть VID)
+        return sorted(p.device for p in list_ports.comports() if p.vid is not None)
+
+    def publish_spectrum(self, freqs, mags):
+        # Очередь на один кадр: непрочитанный устаревший кадр заменяется новым.
+        # Если новый кадр без сетки частот, переносим сетку из вытесненного
+        try:
+            old_freqs, _ = self.data_queue.get_nowait()
+            if freqs is None:
+                freqs = old_freqs
+        except queue.Empty:
+            pass
+        # Кладёт только этот поток, поэтому после get_nowait() место в очереди есть
+        self.data_queue.put_nowait((freqs, mags))
 
     def run(self):
         while not self.connect_to_device():
@@ -190,53 +223,79 @@ class SpectrumWorker(QThread):
             self.status_changed.emit("Ошибка подключения к Arduino")
 
         self.running = True
+        # Запросы спектра отправляет только этот поток — он единственный владелец self.ser
+        next_request = time.monotonic()
         try:
             while self.running:
                 if not self.ser or not self.ser.is_open:
                     self.status_changed.emit("Устройство отключено. Попытка переподключения...")
                     while not self.connect_to_device():
                         time.sleep(5)
+                    next_request = time.monotonic()
+
+                now = time.monotonic()
+                if now >= next_request:
                     get_spectrum(self.ser)
+                    next_request = now + self.request_interval
 
-                data = self.ser.read(1024)
+                # Ждём первый байт, затем забираем всё, что уже накопилось в порту
+                data = self.ser.read(1)
+                if data and self.ser.in_waiting:
+                    data += self.ser.read(self.ser.in_waiting)
                 if data:
-                    self.raw_data_received.emit(data)
+                    # data — неизменяемый bytes, поэтому memoryview безопасно передавать в поток GUI без копии
+                    self.raw_data_received.emit(memoryview(data))
                     self.buffer.extend(data)
+                    if len(self.buffer) > self.max_buffer_size:
+                        # Поток без заголовков: отбрасываем самые старые байты
+                        overflow = len(self.buffer) - self.max_buffer_size
+                        del self.buffer[:overflow]
+                        self._scan_start = max(0, self._scan_start - overflow)
                     while True:
-                        start_idx = self.buffer.find(b'\xBB')
+                        start_idx = self.buffer.find(b'\xBB', self._scan_start)
                         if start_idx == -1:
+                            # Продолжим поиск с текущего конца, когда придут новые данные
+                            self._scan_start = len(self.buffer)
                             break
-                        self.buffer = self.buffer[start_idx:]
+                        del self.buffer[:start_idx]
+                        self._scan_start = 0
                         if len(self.buffer) < 4:
                             break
                         payload_len = struct.unpack('<H', self.buffer[2:4])[0]
                         packet_len = 6 + payload_len
                         if len(self.buffer) < packet_len:
                             break
-                        packet = self.buffer[:packet_len]
-                        self.buffer = self.buffer[packet_len:]
+                        packet = bytes(self.buffer[:packet_len])
+                        del self.buffer[:packet_len]
 
                         mags, freqs = parse_response(packet)
                         if mags is not None and freqs is not None:
                             current_time = time.time()
+                            # Одна редукция без булевой маски: о пике судим по самому сильному бину
                             has_peak = False
-                            for amp, freq in zip(mags, freqs):
-                                if amp > self.threshold:
-                                    has_peak = True
-                                    logging.info(f"Peak detected: {amp} dBm @ {freq} MHz")
-                                    if (current_time - self.last_alert_time) > self.min_alert_interval:
-                                        self.alert_triggered.emit(amp, freq)
-                                        self.last_alert_time = current_time
-
-                            # Управление светодиодом
-                            if has_peak:
-                                self.send_to_arduino('1')
+                            if mags.size:
+                                idx = int(np.argmax(mags))
+                                has_peak = bool(mags[idx] > self.threshold)
+                            if has_peak and (current_time - self.last_alert_time) > self.min_alert_interval:
+                                amp, freq = float(mags[idx]), float(freqs[idx])
+                                logging.info(f"Peak detected: {amp} dBm @ {freq} MHz")
+                                self.alert_triggered.emit(amp, freq)
+                                self.last_alert_time = current_time
+
+                            # Управление светодиодом: пишем в порт только при смене состояния
+                            led_cmd = self._CMD_ON if has_peak else self._CMD_OFF
+                            if led_cmd != self._led_state and self.send_to_arduino(led_cmd):
+                                self._led_state = led_cmd
+
+                            # Для отображения хватает float16; сетку частот передаём только при её изменении
+                            if self._sent_freqs is not None and np.array_equal(freqs, self._sent_freqs):
+                                freqs_out = None
                             else:
-                                self.send_to_arduino('0')
-
-                            self.data_updated.emit(freqs.tolist(), mags.tolist())
+                                freqs_out = self._sent_freqs = freqs
+                            self.publish_spectrum(freqs_out, mags.astype(np.float16))
         except Exception as e:
             self.buffer.clear()
+            self._scan_start = 0
             self.status_changed.emit(f"Ошибка: {e}")
             logging.error(f"An error occurred: {e}")
         finally:
@@ -309,17 +368,15 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
 
     def init_worker(self):
-        self.worker = SpectrumWorker()
+        self.data_queue = queue.Queue(maxsize=1)  # Только последний спектр
+        self._last_freqs = None
+
+        self.worker = SpectrumWorker(self.data_queue)
         self.worker.status_changed.connect(self.update_status)
         self.worker.alert_triggered.connect(self.show_alert)
         self.worker.raw_data_received.connect(self.handle_raw_data)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.request_spectrum)
-        self.timer.setInterval(1000)
-
         self.worker.start()
-        self.timer.start()
 
     def update_status(self, message):
         self.status_label.setText(f"Статус: {message}")
@@ -329,12 +386,22 @@ class MainWindow(QMainWindow):
         self.warning_label.setText(f"Внимание! Обнаружен сигнал: {amp:.1f} dBm @ {freq:.2f} MHz")
         self.warning_label.setVisible(True)
 
-    def handle_raw_data(self, data):
-        logging.debug(f"Received raw data: {data.hex()}")
+    def take_spectrum(self):
+        # Забрать последний кадр для отрисовки: (freqs, mags) или None, если нового нет.
+        # В очереди не больше одного, самого свежего, кадра;
+        # freqs равен None, если сетка частот не изменилась с прошлого кадра
+        try:
+            freqs, mags = self.data_queue.get_nowait()
+        except queue.Empty:
+            return None
+        if freqs is None:
+            freqs = self._last_freqs
+        self._last_freqs = freqs
+        return freqs, mags
 
-    def request_spectrum(self):
-        if self.worker.isRunning():
-            get_spectrum(self.worker.ser)
+    def handle_raw_data(self, data):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Received raw data: {data.hex()}")
 
     def toggle_sound(self):
         sound_on = not self.sound_button.property("soundOn")
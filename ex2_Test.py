@@ -7,10 +7,15 @@ import logging
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.ticker import FuncFormatter, MultipleLocator
-from scipy.ndimage import median_filter
 from scipy.signal import find_peaks
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from numba import njit
+except ImportError:  # Numba необязателен: без него используются реализации на NumPy
+    njit = None
 
 logging.basicConfig(
     filename='spectrum_log.txt',
@@ -18,6 +23,8 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
+# Корневой логгер: подсчёт для отладочных сообщений выполняем только при включённом DEBUG
+logger = logging.getLogger()
 
 PORT = "/dev/ttyACM0"
 BAUDRATE = 115200
@@ -28,40 +35,121 @@ Commands = {
     'SET_GENERATOR_POINT': 0xC3
 }
 
+if njit is not None:
+    @njit(cache=True, boundscheck=False)
+    def _fletcher_numba(a):
+        ca = 0
+        cb = 0
+        for i in range(a.shape[0]):
+            ca = (ca + a[i]) & 0xFF
+            cb = (cb + ca) & 0xFF
+        return ca, cb
+else:
+    _fletcher_numba = None
+
+# Минимальная длина данных, с которой выгоднее векторный расчёт контрольной суммы
+FLETCHER_VECTOR_MIN_LEN = 64
+
 def fletcher_checksum(data):
-    CK_A = 0
-    CK_B = 0
-    for byte in data:
-        CK_A = (CK_A + byte) % 256
-        CK_B = (CK_B + CK_A) % 256
-    return CK_A, CK_B
+    # Короткие команды быстрее посчитать обычным циклом
+    if len(data) < FLETCHER_VECTOR_MIN_LEN:
+        CK_A = 0
+        CK_B = 0
+        for byte in data:
+            CK_A = (CK_A + byte) % 256
+            CK_B = (CK_B + CK_A) % 256
+        return CK_A, CK_B
+
+    a = np.frombuffer(data, dtype=np.uint8)
+    if _fletcher_numba is not None:
+        ca, cb = _fletcher_numba(a)
+        return int(ca), int(cb)
+
+    # Как в fletcher4: накапливаем в широких 64-битных суммах и сводим к 8 битам один раз в конце
+    ca = np.cumsum(a, dtype=np.uint64)
+    cb = np.cumsum(ca, dtype=np.uint64)
+    return int(ca[-1]) & 0xFF, int(cb[-1]) & 0xFF
+
+if njit is not None:
+    @njit(cache=True)
+    def _median3_numba(x, out):
+        # Медиана по 3 точкам и максимум результата за один проход; крайние отсчёты уже в out
+        n = x.shape[0]
+        peak = max(out[0], out[n - 1])
+        for i in range(1, n - 1):
+            a = x[i - 1]
+            b = x[i]
+            c = x[i + 1]
+            m = max(min(a, b), min(max(a, b), c))
+            out[i] = m
+            if m > peak:
+                peak = m
+        return peak
+else:
+    _median3_numba = None
+
+def median3_max(x, out=None):
+    # Медианный фильтр с окном 3 без сортировки: median(a, b, c) = max(min(a, b), min(max(a, b), c)).
+    # Крайние отсчёты не меняются, как у median_filter(size=3) в режиме 'reflect'.
+    # Возвращает отфильтрованный спектр и его максимум
+    if out is None:
+        out = np.empty_like(x)
+    if x.shape[0] < 3:
+        out[:] = x
+        return out, out.max()
+    out[0] = x[0]
+    out[-1] = x[-1]
+    if _median3_numba is not None:
+        return out, _median3_numba(x, out)
+    a, b, c = x[:-2], x[1:-1], x[2:]
+    np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c), out=out[1:-1])
+    return out, out.max()
+
+# Буфер приёма на кадр максимальной длины: заголовок 4 байта + до 65535 байт данных + 2 байта CRC
+MAX_FRAME = 4 + 0xFFFF + 2
+_rx_buf = bytearray(MAX_FRAME)
 
 def parse_response(serial_conn):
     try:
-        header = serial_conn.read(4)
-        if len(header) < 4:
+        mv = memoryview(_rx_buf)
+        if serial_conn.readinto(mv[:4]) < 4:
             return None, None
 
-        payload_len = struct.unpack('<H', header[2:4])[0]
-        response_data = serial_conn.read(payload_len)
-        if len(response_data) < payload_len:
+        payload_len = mv[2] | (mv[3] << 8)  # uint16, little-endian
+        # Данные и CRC читаем одним вызовом
+        if serial_conn.readinto(mv[4:6 + payload_len]) < payload_len + 2:
             return None, None
 
-        received_crc = serial_conn.read(2)
-        calc_crc1, calc_crc2 = fletcher_checksum(header + response_data)
-        if received_crc != bytes([calc_crc1, calc_crc2]):
+        calc_crc1, calc_crc2 = fletcher_checksum(mv[:4 + payload_len])
+        if mv[4 + payload_len] != calc_crc1 or mv[5 + payload_len] != calc_crc2:
             return None, None
 
-        float_data = struct.unpack(f'<{payload_len // 4}f', response_data)
-        mags = np.array(float_data[:len(float_data) // 2])
-        freqs = np.array(float_data[len(float_data) // 2:]) / 1e6  # Преобразование в МГц
+        float_data = np.frombuffer(_rx_buf, dtype='<f4', count=payload_len // 4, offset=4)
+        half = float_data.size // 2
+        # Буфер перезапишет следующий ответ, поэтому амплитуды копируются
+        mags = float_data[:half].copy()
+        freqs = float_data[half:] * np.float32(1e-6)  # Преобразование в МГц
         return mags, freqs
     except serial.SerialException:
         return None, None
 
+# Формат команды GET_SPECTRUM_FLOAT и переиспользуемый буфер под команду + 2 байта CRC
+_SPECTRUM_CMD = struct.Struct('<BBHQQBBB')
+_spectrum_cmd_buf = bytearray(_SPECTRUM_CMD.size + 2)
+
+def _fletcher_cmd(b):
+    # Контрольная сумма команды GET_SPECTRUM_FLOAT фиксированной длины (23 байта) без цикла:
+    # CK_A = Σbᵢ, CK_B = Σ(n - i)·bᵢ по модулю 256
+    ck_a = sum(b)
+    ck_b = (23 * b[0] + 22 * b[1] + 21 * b[2] + 20 * b[3] + 19 * b[4] + 18 * b[5] +
+            17 * b[6] + 16 * b[7] + 15 * b[8] + 14 * b[9] + 13 * b[10] + 12 * b[11] +
+            11 * b[12] + 10 * b[13] + 9 * b[14] + 8 * b[15] + 7 * b[16] + 6 * b[17] +
+            5 * b[18] + 4 * b[19] + 3 * b[20] + 2 * b[21] + 1 * b[22])
+    return ck_a & 0xFF, ck_b & 0xFF
+
 def get_spectrum_float(serial_conn, start_freq, stop_freq, rfin=2, bw=3, speed=0):
-    command = struct.pack(
-        '<BBHQQBBB',
+    _SPECTRUM_CMD.pack_into(
+        _spectrum_cmd_buf, 0,
         0xBB,
         Commands['GET_SPECTRUM_FLOAT'],
         19,
@@ -69,11 +157,12 @@ def get_spectrum_float(serial_conn, start_freq, stop_freq, rfin=2, bw=3, speed=0
         stop_freq,
         rfin, bw, speed
     )
-    crc1, crc2 = fletcher_checksum(command)
-    command += struct.pack('BB', crc1, crc2)
+    crc1, crc2 = _fletcher_cmd(memoryview(_spectrum_cmd_buf)[:_SPECTRUM_CMD.size])
+    _spectrum_cmd_buf[-2] = crc1
+    _spectrum_cmd_buf[-1] = crc2
 
     try:
-        serial_conn.write(command)
+        serial_conn.write(_spectrum_cmd_buf)
         response = parse_response(serial_conn)
         return response
     except serial.SerialException:
@@ -95,8 +184,15 @@ class SpectrumAnalyzerApp:
             # (1500000000, 1850000000, None),
         ]
         self.alert_flags = [{'high': False} for _ in self.scan_ranges]
-        self.ignored_ranges = set()
+        # scan_ranges меняют Tk-поток и калибровка: изменения и снимки списка — под блокировкой
+        self._ranges_lock = threading.Lock()
+        # Один постоянный поток для наладочного периода вместо нового потока на каждый запуск
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._calibration_future = None
         self.persistent_signals = set()
+        # Отсортированные частоты постоянных сигналов (МГц), исключаемые из обработки
+        self._ignored_freqs = np.empty(0, dtype=np.float32)
+        self.ignore_freq_tolerance = 0.001  # Допуск совпадения частоты в МГц
 
         # Диапазон частот для отображения
         self.display_range = (200000000,1300000000)
@@ -134,19 +230,33 @@ class SpectrumAnalyzerApp:
         self.ax = self.fig.add_subplot(111)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.canvas_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.init_plot()
 
         self.serial_conn = None
         self.connect_to_device()
 
+        # Порт используют поток опроса и калибровка: одна транзакция запрос-ответ за раз
+        self._serial_lock = threading.Lock()
+        # Последний кадр от потока опроса и признак того, что Tk его уже забрал
+        self._latest = None
+        self._lock = threading.Lock()
+        self._frame_consumed = threading.Event()
+        self._frame_consumed.set()
+
+        self._filt_buf = np.empty(0, dtype=np.float32)  # Буфер медианного фильтра для основного графика
+
         self.ema_alpha = 0.1  # Начальное значение коэффициента сглаживания
-        self.ema_values = [None] * len(self.scan_ranges)  # Хранение текущих значений EMA для каждого диапазона
+        self.ema_values = np.full(len(self.scan_ranges), np.nan, dtype=np.float32)  # Хранение текущих значений EMA для каждого диапазона (nan — ещё нет)
 
         self.hysteresis_threshold = 0.5  # Гистерезис в дБм
+        self.peak_prominence = 1.0  # Минимальная выраженность пика на графике в дБм
         self.stability_duration = 3  # Время стабильности в секундах
-        self.stability_counter = [0] * len(self.scan_ranges)
+        self.stability_counter = np.zeros(len(self.scan_ranges), dtype=np.int32)
 
         self.auto_calibrate_thresholds()
 
+        threading.Thread(target=self.acquisition_loop, daemon=True).start()
+
         self.update_range_listbox()
         self.update_spectrum()
 
@@ -157,6 +267,46 @@ class SpectrumAnalyzerApp:
             messagebox.showerror("Ошибка", f"Не удалось подключиться к порту {PORT}: {e}")
             self.serial_conn = None
 
+    def read_spectrum(self, start_freq, stop_freq):
+        with self._serial_lock:
+            return get_spectrum_float(self.serial_conn, start_freq, stop_freq)
+
+    def acquisition_loop(self):
+        # Опрос устройства вне Tk: mainloop только отрисовывает готовый кадр
+        while True:
+            self._frame_consumed.wait()
+            if not self.serial_conn:
+                time.sleep(0.5)
+                continue
+            self._frame_consumed.clear()
+
+            start_freq, stop_freq = self.display_range
+            display = self.read_spectrum(start_freq, stop_freq)
+            display_mags, display_freqs = display
+            ranges = {}
+            for start, stop, _ in self.snapshot_ranges():
+                if display_mags is not None and start_freq <= start and stop <= stop_freq:
+                    # Диапазон внутри отображаемого: берём срез уже полученного спектра вместо нового запроса
+                    sel = (display_freqs >= start / 1e6) & (display_freqs <= stop / 1e6)
+                    if sel.any():
+                        ranges[(start, stop)] = (display_mags[sel], display_freqs[sel])
+                        continue
+                ranges[(start, stop)] = self.read_spectrum(start, stop)
+
+            with self._lock:
+                self._latest = (display, ranges)
+
+    def snapshot_ranges(self):
+        with self._ranges_lock:
+            return list(self.scan_ranges)
+
+    def set_range_threshold(self, start, stop, threshold):
+        # Диапазон ищется по границам: пока шла калибровка, список мог измениться
+        with self._ranges_lock:
+            for i, (range_start, range_stop, _) in enumerate(self.scan_ranges):
+                if (range_start, range_stop) == (start, stop):
+                    self.scan_ranges[i] = (start, stop, threshold)
+
     def reconnect_device(self):
         if self.serial_conn:
             self.serial_conn.close()
@@ -185,14 +335,16 @@ class SpectrumAnalyzerApp:
     def auto_calibrate_thresholds(self):
         if self.serial_conn:
             for i, (start, stop, _) in enumerate(self.scan_ranges):
-                amplitudes = []
-                for _ in range(500):  # Уменьшено количество измерений
-                    mags, _ = get_spectrum_float(self.serial_conn, start, stop)
+                amplitudes = np.empty(500, dtype=np.float32)  # Уменьшено количество измерений
+                count = 0
+                for _ in range(amplitudes.size):
+                    mags, _ = self.read_spectrum(start, stop)
                     if mags is not None:
-                        amplitudes.append(mags.max())
+                        amplitudes[count] = mags.max()
+                        count += 1
 
-                if amplitudes:
-                    median_amplitude = np.median(amplitudes)
+                if count:
+                    median_amplitude = float(np.median(amplitudes[:count]))
                     threshold = median_amplitude + 1
                     round_threshold = round(threshold, 1)
                     self.scan_ranges[i] = (start, stop, round_threshold)
@@ -202,120 +354,208 @@ class SpectrumAnalyzerApp:
 
     def update_range_listbox(self):
         self.range_listbox.delete(0, tk.END)
-        for start, stop, round_threshold in self.scan_ranges:
+        for start, stop, round_threshold in self.snapshot_ranges():
             self.range_listbox.insert(tk.END, f"{start/1e6:.1f} - {stop/1e6:.1f} МГц, Порог: {round_threshold} дБм")
 
     def process_spectrum(self, mags, freqs):
+        # np.median уже использует выбор через partition (O(n)); маска считается один раз
         median_value = np.median(mags)
-        filtered_mags = mags[mags > median_value]
-        filtered_freqs = freqs[mags > median_value]
-        return filtered_mags, filtered_freqs
+        mask = mags > median_value
+        return mags[mask], freqs[mask]
 
     def update_spectrum(self):
-        if self.serial_conn:
-            self.ax.clear()
-
-            if not self.scan_ranges:
-                self.ax.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center', fontsize=12, color='red')
+        # Забираем последний готовый кадр; если нового нет, ждём следующего тика
+        with self._lock:
+            frame, self._latest = self._latest, None
+        if frame is not None:
+            self._frame_consumed.set()
+
+        if self.serial_conn and frame is not None:
+            display, ranges = frame
+            scan_ranges = self.snapshot_ranges()
+
+            if not scan_ranges:
+                self.show_plot_message('Нет данных для отображения')
             else:
                 # Отображение только одного диапазона частот
-                start_freq, stop_freq = self.display_range
-                mags, freqs = get_spectrum_float(self.serial_conn, start_freq, stop_freq)
+                mags, freqs = display
                 if mags is not None and freqs is not None:
-                    # Медианная фильтрация
-                    mags = median_filter(mags, size=3)
+                    # Медианная фильтрация; максимум считается в том же проходе
+                    if self._filt_buf.shape != mags.shape:
+                        self._filt_buf = np.empty_like(mags)
+                    mags, filtered_max = median3_max(mags, out=self._filt_buf)
 
                     # Игнорирование известных значений
-                    mags, freqs = self.ignore_known_values(mags, freqs)
+                    if self._ignored_freqs.size:
+                        mags, freqs = self.ignore_known_values(mags, freqs)
+                        filtered_max = mags.max()
 
                     # Обработка спектра
                     filtered_mags, filtered_freqs = self.process_spectrum(mags, freqs)
 
-                    # Обновление EMA
-                    ema_value = self.update_ema(filtered_mags.max(), 0)
+                    # Обновление EMA: максимум значений выше медианы равен максимуму всего спектра
+                    ema_value = self.update_ema(filtered_max, 0)
                     threshold_high = ema_value + 1  # Порог на основе EMA
                     threshold_low = threshold_high - self.hysteresis_threshold  # Нижний порог гистерезиса
 
                     # Обнаружение пиков
-                    peaks, _ = find_peaks(filtered_mags, height=threshold_high)
+                    # distance и prominence отсекают шумовые всплески рядом с настоящими пиками
+                    peaks, _ = find_peaks(filtered_mags,
+                                          height=(threshold_high, None),
+                                          distance=max(1, len(filtered_mags) // 200),
+                                          prominence=self.peak_prominence)
                     peak_freqs = filtered_freqs[peaks]
                     peak_mags = filtered_mags[peaks]
 
-                    self.ax.plot(filtered_freqs, filtered_mags, color='blue', label='Спектр')
-                    self.ax.axhline(y=threshold_high, color='red', linestyle='--', label='Порог')
-
-                    # Отображение пиков
-                    for peak_freq, peak_mag in zip(peak_freqs, peak_mags):
-                        self.ax.plot(peak_freq, peak_mag, "x", color='green')
-                        self.ax.annotate(f'{peak_freq:.1f} МГц\n{peak_mag:.1f} дБм',
-                                         (peak_freq, peak_mag),
-                                         textcoords="offset points",
-                                         xytext=(5,5),
-                                         ha='center')
-
-            self.ax.set_title("Спектр")
-            self.ax.set_xlabel("Частота (МГц)")
-            self.ax.set_ylabel("Амплитуда (дБм)")
-
-            # Форматирование меток на оси X
-            self.ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.1f}'))
-
-            # Добавление сетки
-            self.ax.grid(True)
-
-            # Улучшение меток на осях
-            self.ax.xaxis.set_major_locator(MultipleLocator(50))
-            self.ax.xaxis.set_minor_locator(MultipleLocator(10))
-            self.ax.yaxis.set_major_locator(MultipleLocator(10))
-            self.ax.yaxis.set_minor_locator(MultipleLocator(5))
-
-            # Добавление легенды
-            self.ax.legend()
-
-            self.canvas.draw()
+                    self.draw_spectrum(filtered_freqs, filtered_mags, threshold_high, peak_freqs, peak_mags)
 
             # Выполнение вычислительных процессов в фоновом режиме
-            self.background_processing()
+            self.background_processing(ranges, scan_ranges)
 
         self.root.after(500, self.update_spectrum)
 
-    def background_processing(self):
-        for i, (start, stop, _) in enumerate(self.scan_ranges):
-            mags, freqs = get_spectrum_float(self.serial_conn, start, stop)
-            if mags is not None:
-                # Медианная фильтрация
-                mags = median_filter(mags, size=3)
-
-                # Игнорирование известных значений
-                mags, freqs = self.ignore_known_values(mags, freqs)
-
-                # Обработка спектра
-                filtered_mags, _ = self.process_spectrum(mags, freqs)
-
-                # Обновление EMA
-                ema_value = self.update_ema(filtered_mags.max(), i)
-                threshold_high = ema_value + 1  # Порог на основе EMA
-                threshold_low = threshold_high - self.hysteresis_threshold  # Нижний порог гистерезиса
+    def init_plot(self):
+        # Объекты графика создаются один раз: на каждом тике меняются только их данные
+        self.ax.set_title("Спектр")
+        self.ax.set_xlabel("Частота (МГц)")
+        self.ax.set_ylabel("Амплитуда (дБм)")
+        self.ax.set_xlim(self.display_range[0] / 1e6, self.display_range[1] / 1e6)
+
+        # Форматирование меток на оси X
+        self.ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.1f}'))
+
+        # Добавление сетки
+        self.ax.grid(True)
+
+        # Улучшение меток на осях
+        self.ax.xaxis.set_major_locator(MultipleLocator(50))
+        self.ax.xaxis.set_minor_locator(MultipleLocator(10))
+        self.ax.yaxis.set_major_locator(MultipleLocator(10))
+        self.ax.yaxis.set_minor_locator(MultipleLocator(5))
+
+        # Анимируемые объекты рисуются поверх сохранённого фона (blit)
+        self.spectrum_line, = self.ax.plot([], [], color='blue', label='Спектр', animated=True)
+        self.threshold_line = self.ax.axhline(y=0, color='red', linestyle='--', label='Порог', animated=True)
+        self.peak_markers, = self.ax.plot([], [], "x", color='green', animated=True)
+        self.peak_annotations = []
+        self.message_text = self.ax.text(0.5, 0.5, '', transform=self.ax.transAxes, horizontalalignment='center', verticalalignment='center', fontsize=12, color='red', animated=True)
+        self.message_text.set_visible(False)
+
+        # Добавление легенды
+        self.ax.legend()
+
+        self._y_limits = None
+        self._background = None
+        self.canvas.mpl_connect('draw_event', self.on_canvas_draw)
+
+    def on_canvas_draw(self, event):
+        # После полной перерисовки (в том числе при изменении размеров окна) сохраняем новый фон
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artist in (self.spectrum_line, self.threshold_line, self.peak_markers, self.message_text, *self.peak_annotations):
+            self.ax.draw_artist(artist)
+
+    def refresh_plot(self, full=False):
+        if full or self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self.draw_animated()
+        self.canvas.blit(self.ax.bbox)
+
+    def update_plot_limits(self, mags, threshold):
+        # Ось Y только расширяется, чтобы фон не приходилось перерисовывать на каждом кадре
+        low = min(float(mags.min()), threshold)
+        high = max(float(mags.max()), threshold)
+        if self._y_limits is not None and self._y_limits[0] <= low and high <= self._y_limits[1]:
+            return False
+        if self._y_limits is not None:
+            low = min(low, self._y_limits[0])
+            high = max(high, self._y_limits[1])
+        self._y_limits = (low - 5, high + 5)
+        self.ax.set_ylim(*self._y_limits)
+        return True
+
+    def show_plot_message(self, message):
+        for artist in (self.spectrum_line, self.threshold_line, self.peak_markers, *self.peak_annotations):
+            artist.set_visible(False)
+        self.message_text.set_text(message)
+        self.message_text.set_visible(True)
+        self.refresh_plot()
+
+    def draw_spectrum(self, freqs, mags, threshold, peak_freqs, peak_mags):
+        self.message_text.set_visible(False)
+        self.spectrum_line.set_data(freqs, mags)
+        self.threshold_line.set_ydata([threshold, threshold])
+        self.peak_markers.set_data(peak_freqs, peak_mags)
+        for artist in (self.spectrum_line, self.threshold_line, self.peak_markers):
+            artist.set_visible(True)
+
+        # Отображение пиков: подписи берутся из пула, лишние скрываются
+        while len(self.peak_annotations) < len(peak_freqs):
+            annotation = self.ax.annotate('', (0, 0),
+                                          textcoords="offset points",
+                                          xytext=(5,5),
+                                          ha='center',
+                                          animated=True)
+            self.peak_annotations.append(annotation)
+        for i, annotation in enumerate(self.peak_annotations):
+            if i < len(peak_freqs):
+                annotation.xy = (peak_freqs[i], peak_mags[i])
+                annotation.set_text(f'{peak_freqs[i]:.1f} МГц\n{peak_mags[i]:.1f} дБм')
+                annotation.set_visible(True)
+            else:
+                annotation.set_visible(False)
 
-                # Обнаружение пиков
-                peaks, _ = find_peaks(filtered_mags, height=threshold_high)
+        self.refresh_plot(full=self.update_plot_limits(mags, threshold))
 
-                if filtered_mags.max() > threshold_high:
-                    self.stability_counter[i] += 1
-                    if self.stability_counter[i] >= self.stability_duration and not self.alert_flags[i]['high']:
-                        self.alert_flags[i]['high'] = True
-                        self.show_alert(f"Превышение порога в диапазоне {start/1e6}-{stop/1e6} МГц!")
-                        logging.warning(f"Превышение порога в диапазоне {start/1e6}-{stop/1e6} МГц на амплитуде {filtered_mags.max():.1f} дБм!")
-                elif filtered_mags.max() <= threshold_low:
-                    self.alert_flags[i]['high'] = False
-                    self.stability_counter[i] = 0
+    def background_processing(self, ranges, scan_ranges):
+        # Максимумы всех диапазонов за тик; nan — для диапазона нет данных
+        current = np.full(len(scan_ranges), np.nan, dtype=np.float32)
+        for i, (start, stop, _) in enumerate(scan_ranges):
+            mags, freqs = ranges.get((start, stop), (None, None))
+            if mags is not None:
+                # Для порога нужен только максимум: фильтрация и поиск пиков остаются на основном графике
+                mags, _ = self.ignore_known_values(mags, freqs)
+                if mags.size:
+                    current[i] = mags.max()
+
+        # Обновление EMA и порогов сразу для всех диапазонов
+        ema_values = self.update_ema_all(current)
+        thresholds_high = ema_values + 1  # Пороги на основе EMA
+        thresholds_low = thresholds_high - self.hysteresis_threshold  # Нижние пороги гистерезиса
+
+        # Сравнение с nan всегда ложно, поэтому диапазоны без данных не меняют состояние
+        above = current > thresholds_high
+        below = current <= thresholds_low
+        self.stability_counter[above] += 1
+        self.stability_counter[below] = 0
+        for i in np.flatnonzero(below):
+            self.alert_flags[i]['high'] = False
+
+        for i in np.flatnonzero(above & (self.stability_counter >= self.stability_duration)):
+            if not self.alert_flags[i]['high']:
+                start, stop, _ = scan_ranges[i]
+                self.alert_flags[i]['high'] = True
+                self.show_alert(f"Превышение порога в диапазоне {start/1e6}-{stop/1e6} МГц!")
+                logging.warning(f"Превышение порога в диапазоне {start/1e6}-{stop/1e6} МГц на амплитуде {current[i]:.1f} дБм!")
 
     def update_ema(self, current_value, index):
-        if self.ema_values[index] is None:
+        if np.isnan(self.ema_values[index]):
             self.ema_values[index] = current_value
         else:
             self.ema_values[index] = self.ema_alpha * current_value + (1 - self.ema_alpha) * self.ema_values[index]
-        return self.ema_values[index]
+        return float(self.ema_values[index])
+
+    def update_ema_all(self, current_values):
+        # Векторное обновление EMA: nan в ema — первое значение, nan в current_values — нет данных
+        ema = self.ema_values
+        blended = self.ema_alpha * current_values + (1 - self.ema_alpha) * ema
+        self.ema_values = np.where(np.isnan(current_values), ema,
+                                   np.where(np.isnan(ema), current_values, blended)).astype(np.float32)
+        return self.ema_values
 
     def show_alert(self, message):
         alert = tk.Toplevel(self.root)
@@ -344,10 +584,11 @@ class SpectrumAnalyzerApp:
         threshold = simpledialog.askfloat("Добавить диапазон", "Порог амплитуды (дБм):")
 
         if start_freq is not None and stop_freq is not None and threshold is not None:
-            self.scan_ranges.append((int(start_freq * 1e6), int(stop_freq * 1e6), threshold))
+            with self._ranges_lock:
+                self.scan_ranges.append((int(start_freq * 1e6), int(stop_freq * 1e6), threshold))
             self.alert_flags.append({'high': False})
-            self.ema_values.append(None)  # Добавление нового значения EMA
-            self.stability_counter.append(0)  # Добавление нового счетчика стабильности
+            self.ema_values = np.append(self.ema_values, np.float32(np.nan))  # Добавление нового значения EMA
+            self.stability_counter = np.append(self.stability_counter, np.int32(0))  # Добавление нового счетчика стабильности
             self.update_range_listbox()
             logging.info(f"Добавлен новый диапазон: {start_freq}-{stop_freq} МГц, Порог: {threshold} дБм")
 
@@ -365,7 +606,8 @@ class SpectrumAnalyzerApp:
         threshold = simpledialog.askfloat("Редактировать диапазон", "Порог амплитуды (дБм):", initialvalue=self.scan_ranges[index][2])
 
         if start_freq is not None and stop_freq is not None and threshold is not None:
-            self.scan_ranges[index] = (int(start_freq * 1e6), int(stop_freq * 1e6), threshold)
+            with self._ranges_lock:
+                self.scan_ranges[index] = (int(start_freq * 1e6), int(stop_freq * 1e6), threshold)
             self.update_range_listbox()
             logging.info(f"Отредактирован диапазон: {start_freq}-{stop_freq} МГц, Порог: {threshold} дБм")
 
@@ -380,62 +622,81 @@ class SpectrumAnalyzerApp:
         index = selected[0]
         start_freq = self.scan_ranges[index][0] / 1e6
         stop_freq = self.scan_ranges[index][1] / 1e6
-        del self.scan_ranges[index]
+        with self._ranges_lock:
+            del self.scan_ranges[index]
         del self.alert_flags[index]
-        del self.ema_values[index]  # Удаление значения EMA
-        del self.stability_counter[index]  # Удаление счетчика стабильности
+        self.ema_values = np.delete(self.ema_values, index)  # Удаление значения EMA
+        self.stability_counter = np.delete(self.stability_counter, index)  # Удаление счетчика стабильности
         self.update_range_listbox()
         logging.info(f"Удален диапазон: {start_freq}-{stop_freq} МГц")
 
 
 
     def start_calibration(self):
-        self.ax.clear()
-        self.ax.text(0.5, 0.5, 'Идет сканирование', horizontalalignment='center', verticalalignment='center', fontsize=12, color='red')
-        self.canvas.draw()
+        # Повторные нажатия во время идущей калибровки игнорируются
+        if self._calibration_future is not None and not self._calibration_future.done():
+            logging.info("Наладочный период уже выполняется")
+            return
+
+        self.show_plot_message('Идет сканирование')
+
+        self._calibration_future = self._executor.submit(self.calibration_process)
+        self._calibration_future.add_done_callback(self.on_calibration_done)
 
-        calibration_thread = threading.Thread(target=self.calibration_process)
-        calibration_thread.start()
+    def on_calibration_done(self, future):
+        # Исключения из пула потоков иначе теряются без следа
+        error = future.exception()
+        if error is not None:
+            logging.error("Ошибка наладочного периода", exc_info=error)
 
     def calibration_process(self):
         calibration_time = 2 * 60  # 2 минуты в секундах
         end_time = time.time() + calibration_time
 
         while time.time() < end_time:
-            for i, (start, stop, _) in enumerate(self.scan_ranges):
-                amplitudes = []
-                for _ in range(10):  # Уменьшено количество измерений для оптимизации
-                    mags, _ = get_spectrum_float(self.serial_conn, start, stop)
-                    if mags is not None:
-                        amplitudes.append(mags.max())
-
-                if amplitudes:
-                    max_amplitude = max(amplitudes)
+            for start, stop, _ in self.snapshot_ranges():
+                max_amplitude = self.calibration_max_amplitude(start, stop)
+                if max_amplitude is not None:
                     threshold = max_amplitude + 1
                     round_threshold = round(threshold, 1)
-                    self.scan_ranges[i] = (start, stop, round_threshold)
+                    self.set_range_threshold(start, stop, round_threshold)
 
             time.sleep(1)  # Пауза для предотвращения перегрузки процессора
 
-        self.update_range_listbox()
-        self.update_spectrum()
+        # Обновление списка передаётся в Tk-поток; цикл update_spectrum уже запущен
+        self.root.after(0, self.update_range_listbox)
+
+    def calibration_max_amplitude(self, start, stop):
+        amplitudes = np.empty(10, dtype=np.float32)  # Уменьшено количество измерений для оптимизации
+        count = 0
+        for _ in range(amplitudes.size):
+            mags, _ = self.read_spectrum(start, stop)
+            if mags is not None:
+                amplitudes[count] = mags.max()
+                count += 1
+        if not count:
+            return None
+
+        return float(amplitudes[:count].max())
 
     def ignore_known_values(self, mags, freqs):
-        # Игнорирование значений, которые уже были зафиксированы
-        filtered_mags = []
-        filtered_freqs = []
-        for mag, freq in zip(mags, freqs):
-            if (mag, freq) not in self.ignored_ranges:
-                filtered_mags.append(mag)
-                filtered_freqs.append(freq)
-            else:
-                logging.debug(f"Игнорировано значение: {mag} дБм, {freq} МГц")
-        return np.array(filtered_mags), np.array(filtered_freqs)
+        # Игнорирование значений на частотах, которые уже были зафиксированы
+        if not self._ignored_freqs.size:
+            return mags, freqs
+        # Бинарный поиск ближайших соседей слева и справа в отсортированном массиве
+        ignored = self._ignored_freqs
+        idx = np.searchsorted(ignored, freqs)
+        right = ignored[np.minimum(idx, ignored.size - 1)]
+        left = ignored[np.maximum(idx - 1, 0)]
+        known = (np.abs(right - freqs) <= self.ignore_freq_tolerance) | (np.abs(freqs - left) <= self.ignore_freq_tolerance)
+        mask = ~known
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Игнорировано значений: {mask.size - np.count_nonzero(mask)}")
+        return mags[mask], freqs[mask]
 
     def ignore_persistent_signals(self):
-        # Игнорирование постоянных сигналов
-        for freq in self.persistent_signals:
-            self.ignored_ranges.add((freq, freq))
+        # Игнорирование постоянных сигналов: массив пересобирается только при изменении набора
+        self._ignored_freqs = np.array(sorted(self.persistent_signals), dtype=np.float32)
 
     def add_persistent_signal(self, freq):
         # Добавление постоянного сигнала